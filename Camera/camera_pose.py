@@ -1,47 +1,110 @@
+import os
+import queue
+import multiprocessing
 import cv2
+import numpy as np
 import mediapipe as mp
 import time
 
-# Initialize MediaPipe Pose
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7)
-mp_drawing = mp.solutions.drawing_utils
+from frame_grabber import FrameGrabber, open_rtsp_capture
+
+# Force TCP transport and disable FFmpeg buffering so MediaPipe always gets
+# fresh frames instead of seconds-old ones queued by the demuxer
+os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay"
+
+def inference_worker(in_queue, out_queue):
+    # Runs in a separate process so pose inference and stream decoding
+    # can use different cores. The model is built here, in the worker.
+    mp_pose = mp.solutions.pose
+    pose = mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7)
+    mp_drawing = mp.solutions.drawing_utils
+    rgb_frame = None
+
+    while True:
+        frame = in_queue.get()
+        if frame is None:
+            break
+
+        # Convert frame to RGB for MediaPipe, reusing one output buffer
+        if rgb_frame is None or rgb_frame.shape != frame.shape:
+            rgb_frame = np.empty_like(frame)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+        results = pose.process(rgb_frame)
+
+        # If pose landmarks are detected, draw them on the frame
+        if results.pose_landmarks:
+            mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+
+        out_queue.put(frame)
 
 def process_pose(rtsp_url):
-    # Open the RTSP stream for pose detection
-    cap = cv2.VideoCapture(rtsp_url)
+    # Open the RTSP stream for pose detection (hardware decode when available)
+    cap = open_rtsp_capture(rtsp_url)
     time.sleep(2)
     if not cap.isOpened():
         print("Failed to open RTSP stream.")
         return
 
+    # Inference runs in its own process; frames are exchanged over bounded
+    # queues and the capture side drops the oldest frame when full
+    in_queue = multiprocessing.Queue(maxsize=2)
+    out_queue = multiprocessing.Queue(maxsize=2)
+    worker = multiprocessing.Process(target=inference_worker, args=(in_queue, out_queue), daemon=True)
+    worker.start()
+
+    # Grab frames on a separate thread so inference always sees the newest one
+    grabber = FrameGrabber(cap)
+
+    # Reused resize destination; the flipped frame is allocated fresh because
+    # it crosses the process boundary and must not be overwritten in place
+    resized = np.empty((480, 640, 3), dtype=np.uint8)
+
     while True:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
             print("Failed to retrieve frame.")
             break
 
-        # Resize the frame to 640x480
-        frame = cv2.resize(frame, (640, 480))
+        # Resize the frame to 640x480, unless the stream already matches
+        if frame.shape[1] != 640 or frame.shape[0] != 480:
+            cv2.resize(frame, (640, 480), dst=resized)
+            src = resized
+        else:
+            src = frame
 
         # Flip the frame horizontally for a mirror effect
-        frame = cv2.flip(frame, 1)
+        frame = cv2.flip(src, 1)
 
-        # Convert frame to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(rgb_frame)
-
-        # If pose landmarks are detected, draw them on the frame
-        if results.pose_landmarks:
-            mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+        # Hand the frame to the inference process, dropping the oldest on backlog
+        try:
+            in_queue.put_nowait(frame)
+        except queue.Full:
+            try:
+                in_queue.get_nowait()
+            except queue.Empty:
+                pass
+            # The retry can still hit a full queue (the feeder thread and the
+            # bounded semaphore are not atomic); drop the frame in that case
+            try:
+                in_queue.put_nowait(frame)
+            except queue.Full:
+                pass
 
-        # Display the frame with pose landmarks
-        cv2.imshow("Pose Estimation", frame)
+        # Display the most recent annotated frame, if one is ready
+        try:
+            annotated = out_queue.get_nowait()
+        except queue.Empty:
+            annotated = None
+        if annotated is not None:
+            cv2.imshow("Pose Estimation", annotated)
 
         # Press 'q' to quit the window
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    grabber.stop()
+    in_queue.put(None)
+    worker.join(timeout=2)
     cap.release()
     cv2.destroyAllWindows()
 
@@ -0,0 +1,73 @@
+import threading
+
+import cv2
+
+def open_rtsp_capture(rtsp_url):
+    """Open an RTSP stream, preferring hardware H.264 decoding when available.
+
+    Tries a GStreamer pipeline using the NVIDIA decoder (NVDEC) first, which
+    moves decoding off the CPU and drops late frames at the source. Falls back
+    to the FFmpeg software decoder when the pipeline cannot be opened (no
+    GStreamer build of OpenCV, no NVIDIA hardware, ...).
+    """
+    pipeline = (
+        f"rtspsrc location={rtsp_url} latency=0 drop-on-latency=true ! "
+        "rtph264depay ! h264parse ! nvv4l2decoder ! nvvidconv ! "
+        "video/x-raw,format=BGRx ! videoconvert ! "
+        "video/x-raw,format=BGR ! appsink drop=1 sync=0"
+    )
+    cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+    if cap.isOpened():
+        return cap
+    cap.release()
+
+    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # keep only the newest frame
+    return cap
+
+class FrameGrabber:
+    """Reads frames from a VideoCapture on a daemon thread and keeps only the newest one.
+
+    Decouples capture from inference: if processing falls behind the camera,
+    older frames are simply overwritten instead of queuing up, so the consumer
+    always works on the latest frame.
+    """
+
+    def __init__(self, cap):
+        self.cap = cap
+        self._lock = threading.Lock()
+        self._new_frame = threading.Event()
+        self._frame = None
+        self._ok = True
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                self._ok = False
+                self._new_frame.set()
+                break
+            with self._lock:
+                self._frame = frame
+            self._new_frame.set()
+
+    def read(self):
+        """Block until a fresh frame is available, then return (ok, frame)."""
+        self._new_frame.wait()
+        with self._lock:
+            frame = self._frame
+            self._new_frame.clear()
+        return self._ok, frame
+
+    def stop(self):
+        """Stop the reader thread and wait for it to exit.
+
+        Joining matters: callers release the VideoCapture right after this,
+        and releasing it while a cap.read() is still in flight on the reader
+        thread is unsafe in OpenCV.
+        """
+        self._running = False
+        self._thread.join(timeout=2)
@@ -3,15 +3,18 @@ import os
 import cv2
 import time
 import json
+import signal
 import numpy as np
 import mediapipe as mp
-import matplotlib.pyplot as plt
+
+from Camera.frame_grabber import FrameGrabber
 
 # ─── USER CONFIG ─────────────────────────────────────────────────────────────
 VIDEO_DIR      = "recordings"
 JSON_DIR       = "jsons"
 RECORD_SECONDS = 10
 FPS            = 20
+SHOW_UI        = os.environ.get("SHOW_UI", "1") == "1"  # set SHOW_UI=0 for headless runs
 
 os.makedirs(VIDEO_DIR, exist_ok=True)
 os.makedirs(JSON_DIR, exist_ok=True)
@@ -21,27 +24,36 @@ mp_hands = mp.solutions.hands
 hands    = mp_hands.Hands(
     static_image_mode=False,
     max_num_hands=1,
+    model_complexity=0,  # lite model: ~2x faster, plenty for tap distances
     min_detection_confidence=0.6,
     min_tracking_confidence=0.6,
 )
 
+# Landmark indices used by the gesture check
+TIP_IDS  = np.array([4, 8, 12, 16, 20])
+EXT_TIPS = np.array([12, 16, 20])
+EXT_PIPS = np.array([10, 14, 18])
+
+def landmarks_to_array(lm):
+    """Extract all 21 landmarks into a (21,3) float32 array in one pass."""
+    return np.fromiter(
+        (v for p in lm.landmark for v in (p.x, p.y, p.z)),
+        dtype=np.float32, count=63,
+    ).reshape(21, 3)
+
 def is_ok_gesture(lm, w, h):
     """Detects an 'OK' gesture: thumb tip & index tip touching, other fingers extended."""
-    tips = [(int(lm.landmark[i].x * w), int(lm.landmark[i].y * h))
-            for i in (4, 8, 12, 16, 20)]
-    ref = np.mean([
-        np.linalg.norm(np.array(tips[i]) - np.array(tips[i+1]))
-        for i in range(1, 4)
-    ]) or 1.0
+    pts  = landmarks_to_array(lm)
+    tips = pts[TIP_IDS, :2] * (w, h)
+    ref  = np.linalg.norm(np.diff(tips[1:], axis=0), axis=1).mean() or 1.0
 
     # thumb–index close?
-    if np.linalg.norm(np.array(tips[0]) - np.array(tips[1])) > 0.4 * ref:
+    if np.linalg.norm(tips[0] - tips[1]) > 0.4 * ref:
         return False
 
     # other fingers extended?
-    for tip_id, pip_id in zip((12, 16, 20), (10, 14, 18)):
-        if lm.landmark[tip_id].y > lm.landmark[pip_id].y:
-            return False
+    if (pts[EXT_TIPS, 1] > pts[EXT_PIPS, 1]).any():
+        return False
 
     return True
 
@@ -50,55 +62,110 @@ def compute_metrics(landmarks_list, fps):
     Compute normalized tap amplitude (thumb ↔ index) and speed.
     landmarks_list: list of frames, each a list of 21 (x,y,z) tuples.
     """
-    arr = np.array(landmarks_list)  # (N,21,3)
+    arr = np.asarray(landmarks_list, dtype=np.float32)  # (N,21,3); no copy if already float32
     THUMB, INDEX, WRIST, MID = 4, 8, 0, 9
 
-    # distances
-    d_tap = np.linalg.norm(arr[:, THUMB, :2] - arr[:, INDEX, :2], axis=1)
-    d_ref = np.linalg.norm(arr[:, MID,   :2] - arr[:, WRIST, :2], axis=1)
+    # distances (hypot over x/y diffs: one pass, no squared intermediates)
+    d_tap = np.hypot(arr[:, THUMB, 0] - arr[:, INDEX, 0],
+                     arr[:, THUMB, 1] - arr[:, INDEX, 1])
+    d_ref = np.hypot(arr[:, MID,   0] - arr[:, WRIST, 0],
+                     arr[:, MID,   1] - arr[:, WRIST, 1])
 
     amp_norm = d_tap / d_ref
+    # scalar spacing keeps np.gradient on its cheap uniform-grid path
+    speed    = np.gradient(amp_norm, 1.0 / fps)
     times    = np.arange(len(amp_norm)) / fps
-    speed    = np.gradient(amp_norm, times)
     return times, amp_norm, speed
 
 def plot_metrics(times, amp, speed, save_path=None):
-    plt.figure(figsize=(10,4))
-    plt.subplot(1,2,1)
-    plt.plot(times, amp)
-    plt.title("Normalized Tap Amplitude")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Amplitude (a.u.)")
-    plt.subplot(1,2,2)
-    plt.plot(times, speed)
-    plt.title("Tap Speed")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Speed (a.u./s)")
-    plt.tight_layout()
+    """Render the amplitude/speed plot straight to a PNG.
+
+    matplotlib is imported lazily — it adds close to a second of startup
+    time and is only needed once, after a recording finishes. Rendering
+    through the Agg canvas avoids spinning up a GUI backend, so this also
+    works headless (SHOW_UI=0).
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(10, 4))
+    ax1 = fig.add_subplot(1, 2, 1)
+    ax1.plot(times, amp)
+    ax1.set_title("Normalized Tap Amplitude")
+    ax1.set_xlabel("Time (s)")
+    ax1.set_ylabel("Amplitude (a.u.)")
+    ax2 = fig.add_subplot(1, 2, 2)
+    ax2.plot(times, speed)
+    ax2.set_title("Tap Speed")
+    ax2.set_xlabel("Time (s)")
+    ax2.set_ylabel("Speed (a.u./s)")
+    fig.tight_layout()
     if save_path:
-        plt.savefig(save_path)
+        FigureCanvasAgg(fig).print_png(save_path)
         print(f"→ Saved metrics plot to {save_path}")
-    plt.show()
 
-def distance_state(distances, low_thresh=0.5, high_thresh=0.8):
+def load_landmarks(path):
+    """Load a recording's landmarks from .npz (current) or legacy .json files."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return data["landmarks"].astype(np.float32)
+    with open(path, "r") as f:
+        return json.load(f)
+
+def count_taps(distances, low_thresh=0.5, high_thresh=0.8):
     """
-    Convert normalized distances into discrete states:
-      - "closed" if ≤ low_thresh
-      - "open"   if ≥ high_thresh
-      - None     otherwise
+    Count open→closed transitions of the normalized distances.
+    Each sample is "closed" if ≤ low_thresh, "open" if ≥ high_thresh and
+    ignored otherwise; a tap is an open sample followed by a closed one.
     """
-    state = []
-    for d in distances:
-        if d <= low_thresh:
-            state.append("closed")
-        elif d >= high_thresh:
-            state.append("open")
-        else:
-            state.append(None)
-    return state
+    d = np.asarray(distances)
+    states = np.where(d <= low_thresh, -1, np.where(d >= high_thresh, 1, 0))
+    states = states[states != 0]  # drop in-between samples
+    if states.size < 2:
+        return 0
+    return int(np.count_nonzero((states[:-1] == 1) & (states[1:] == -1)))
+
+# ─── ROI tracking ───────────────────────────────────────────────────────────
+ROI_MARGIN  = 0.15  # padding around the last hand bbox, as a fraction of it
+ROI_REFRESH = 30    # re-run on the full frame every N frames
+MOTION_EPS  = 1.5   # mean abs-diff (on a 64x48 thumbnail) below which a frame
+                    # counts as unchanged and inference is skipped
+
+def landmarks_roi(lm, w, h):
+    """Pixel bbox (x0,y0,x1,y1) around the hand, padded by ROI_MARGIN.
+
+    Returns None when the bbox is too small to be a useful crop.
+    """
+    pts = landmarks_to_array(lm)
+    x0, y0 = pts[:, :2].min(axis=0)
+    x1, y1 = pts[:, :2].max(axis=0)
+    mx = (x1 - x0) * ROI_MARGIN
+    my = (y1 - y0) * ROI_MARGIN
+    x0 = int(max(0.0, x0 - mx) * w)
+    y0 = int(max(0.0, y0 - my) * h)
+    x1 = int(min(1.0, x1 + mx) * w)
+    y1 = int(min(1.0, y1 + my) * h)
+    if x1 - x0 < 32 or y1 - y0 < 32:
+        return None
+    return x0, y0, x1, y1
+
+def process_roi(rgb, roi):
+    """Run hand inference on a crop, remapping landmarks to full-frame coords."""
+    h, w = rgb.shape[:2]
+    x0, y0, x1, y1 = roi
+    res = hands.process(rgb[y0:y1, x0:x1])
+    if res.multi_hand_landmarks:
+        sx, sy = (x1 - x0) / w, (y1 - y0) / h
+        ox, oy = x0 / w, y0 / h
+        for lm in res.multi_hand_landmarks:
+            for p in lm.landmark:
+                p.x = ox + p.x * sx
+                p.y = oy + p.y * sy
+    return res
 
 def main():
     cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # keep only the newest frame
     if not cap.isOpened():
         print("ERROR: Cannot open camera.")
         return
@@ -106,23 +173,83 @@ def main():
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+    # Inference runs on a half-size frame: the landmark model resizes its
+    # input internally anyway, so feeding fewer pixels just cuts cvtColor
+    # traffic. Both buffers are reused across iterations (dst=).
+    sw, sh = w // 2, h // 2
+    small = np.empty((sh, sw, 3), dtype=np.uint8)
+    rgb   = np.empty((sh, sw, 3), dtype=np.uint8)
+
     recording     = False
     out           = None
     start_ts      = None
     vid_path      = None
-    json_path     = None
-    landmarks_buf = []
+    data_path     = None
     tap_count     = 0
 
-    print("→ Press 'q' to quit.")
+    # Preallocated landmark storage: frames are written in place instead of
+    # appending lists of tuples (slack for timing jitter past RECORD_SECONDS)
+    landmarks_buf = np.empty((FPS * RECORD_SECONDS + 32, 21, 3), dtype=np.float32)
+    frame_idx     = 0
+
+    if SHOW_UI:
+        print("→ Press 'q' to quit.")
+    else:
+        # Headless: no window event pump, so stop on Ctrl-C instead of 'q'
+        stop_requested = False
+
+        def _on_sigint(signum, frame):
+            nonlocal stop_requested
+            stop_requested = True
+
+        signal.signal(signal.SIGINT, _on_sigint)
+        print("→ Running headless (SHOW_UI=0). Press Ctrl-C to quit.")
+
+    # Grab frames on a separate thread so inference always sees the newest one
+    grabber = FrameGrabber(cap)
+
+    # Cached hand ROI: crop inference to the last known hand location so the
+    # palm detector doesn't scan the full frame; periodically re-check it all
+    roi     = None
+    roi_age = 0
+
+    # Thumbnail of the previous frame for the cheap no-motion gate
+    prev_small = None
+    last_res   = None
 
     while True:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
             break
         frame = cv2.flip(frame, 1)
-        rgb   = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res   = hands.process(rgb)
+        cv2.resize(frame, (sw, sh), dst=small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=rgb)
+
+        # Skip inference while idle if the scene hasn't changed (e.g. the
+        # "show OK gesture" wait state) and reuse the previous landmarks
+        cur_small = cv2.resize(rgb, (64, 48))
+        if (not recording and last_res is not None and prev_small is not None
+                and cv2.absdiff(cur_small, prev_small).mean() < MOTION_EPS):
+            res = last_res
+        elif roi is not None and roi_age < ROI_REFRESH:
+            res = process_roi(rgb, roi)
+            roi_age += 1
+            if not res.multi_hand_landmarks:
+                # hand left the crop — retry on the full frame
+                res = hands.process(rgb)
+                roi_age = 0
+            last_res = res
+        else:
+            res = hands.process(rgb)
+            roi_age = 0
+            last_res = res
+        prev_small = cur_small
+
+        if res.multi_hand_landmarks:
+            # ROI is a crop of the inference frame, so use its dimensions
+            roi = landmarks_roi(res.multi_hand_landmarks[0], sw, sh)
+        else:
+            roi = None
 
         if not recording:
             cv2.putText(frame, "Show OK gesture to start...", (30,30),
@@ -132,12 +259,12 @@ def main():
                 if is_ok_gesture(lm0, w, h):
                     ts = time.strftime("%Y%m%d-%H%M%S")
                     vid_path  = os.path.join(VIDEO_DIR, f"tap_{ts}.avi")
-                    json_path = os.path.join(JSON_DIR,  f"tap_{ts}.json")
+                    data_path = os.path.join(JSON_DIR,  f"tap_{ts}.npz")
                     fourcc    = cv2.VideoWriter_fourcc(*"XVID")
                     out       = cv2.VideoWriter(vid_path, fourcc, FPS, (w,h))
                     recording = True
                     start_ts  = time.time()
-                    landmarks_buf.clear()
+                    frame_idx = 0
                     tap_count = 0
                     print(f"→ OK detected! Recording {RECORD_SECONDS}s to {vid_path} ...")
         else:
@@ -150,15 +277,11 @@ def main():
             else:
                 lm0 = res.multi_hand_landmarks[0]
                 # store landmarks
-                landmarks_buf.append([(p.x, p.y, p.z) for p in lm0.landmark])
+                if frame_idx < len(landmarks_buf):
+                    landmarks_buf[frame_idx] = landmarks_to_array(lm0)
+                    frame_idx += 1
                 out.write(frame)
 
-                # realtime count using state machine
-                # compute normalized distance for this frame
-                thumb = np.array([p.x for p in lm0.landmark[4:5]] + [p.y for p in lm0.landmark[4:5]])
-                # (we'll recompute full series after end for plotting)
-                # Here, we'll just append distance to temp list and count later
-
                 secs_left = max(0, RECORD_SECONDS - int(elapsed))
                 cv2.putText(frame,
                             f"Recording... {secs_left}s",
@@ -168,24 +291,19 @@ def main():
                     out.release()
                     print(f"→ Done! Saved video to {vid_path}")
 
-                    # save JSON
-                    with open(json_path, "w") as f:
-                        json.dump(landmarks_buf, f)
-                    print(f"→ Saved landmarks to {json_path}")
+                    recorded = landmarks_buf[:frame_idx]
+
+                    # save landmarks (compressed binary; ~10x smaller than JSON
+                    # and loads without text parsing)
+                    np.savez_compressed(data_path, landmarks=recorded.astype(np.float16))
+                    print(f"→ Saved landmarks to {data_path}")
 
                     # compute metrics & count taps
-                    times, amp, speed = compute_metrics(landmarks_buf, FPS)
-                    states = distance_state(amp)
-                    # count open→closed transitions
-                    prev = None
-                    for st in states:
-                        if prev == "open" and st == "closed":
-                            tap_count += 1
-                        if st in ("open","closed"):
-                            prev = st
+                    times, amp, speed = compute_metrics(recorded, FPS)
+                    tap_count = count_taps(amp)
 
                     print(f"→ You did {tap_count} thumb–index taps.")
-                    plot_path = json_path.replace(".json", "_metrics.png")
+                    plot_path = data_path.replace(".npz", "_metrics.png")
                     plot_metrics(times, amp, speed, save_path=plot_path)
                     break
 
@@ -194,15 +312,22 @@ def main():
             for lm in res.multi_hand_landmarks:
                 mp.solutions.drawing_utils.draw_landmarks(frame, lm, mp_hands.HAND_CONNECTIONS)
 
-        cv2.imshow("Finger Tapping Recorder", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if SHOW_UI:
+            # imshow/waitKey cost a few ms per frame pumping GUI events, so
+            # skip them entirely when no one is watching
+            cv2.imshow("Finger Tapping Recorder", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+        elif stop_requested:
             break
 
     # cleanup
+    grabber.stop()
     if recording and out:
         out.release()
     cap.release()
-    cv2.destroyAllWindows()
+    if SHOW_UI:
+        cv2.destroyAllWindows()
     print("Program ended.")
 
 if __name__ == "__main__":
@@ -1,19 +1,21 @@
 #!/usr/bin/env python3
 import os
-import json
+import re
 import base64
+import functools
 from io import BytesIO
 import numpy as np
-import matplotlib.pyplot as plt
-from fastapi import FastAPI, Request, Form, File, UploadFile
-from fastapi.responses import HTMLResponse, FileResponse
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from fastapi import FastAPI, Request, Response, Form, File, UploadFile
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
 from pathlib import Path
 
 # Import functions from the finger_tapping.py
-from finger_tapping import compute_metrics, plot_metrics
+from finger_tapping import compute_metrics, count_taps, load_landmarks, plot_metrics
 
 app = FastAPI(title="Finger Tapping Analysis Dashboard")
 
@@ -37,94 +39,118 @@ os.makedirs(JSON_DIR, exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 
 
+@functools.lru_cache(maxsize=4096)
+def _cached_tap_count(json_path, mtime):
+    """Tap count for one recording, cached on (path, mtime).
+
+    Recordings are immutable once written, so the mtime key means each file
+    is parsed and analyzed once instead of on every dashboard page load.
+    """
+    landmarks_list = load_landmarks(json_path)
+    _, amp, _ = compute_metrics(landmarks_list, 20)  # FPS=20
+    return count_taps(amp)
+
+
+# Cached recording list, keyed on the directory mtimes: recordings are only
+# ever added (or removed) by the capture scripts, and either changes the
+# containing directory's mtime, so two stat calls replace a full rescan
+_recordings_cache = {"key": None, "value": None}
+
+
 def get_recordings():
     """Get all recordings with their corresponding JSON and metrics files."""
-    recordings = []
+    cache_key = (os.stat(VIDEO_DIR).st_mtime_ns, os.stat(JSON_DIR).st_mtime_ns)
+    if _recordings_cache["key"] == cache_key:
+        return _recordings_cache["value"]
 
-    # List all JSON files
-    json_files = [f for f in os.listdir(JSON_DIR) if f.endswith('.json')]
+    recordings = []
 
-    for json_file in json_files:
-        base_name = json_file.replace('.json', '')
+    # One directory scan each: entry names and mtimes come from the scandir
+    # pass instead of per-file exists/getmtime stat calls
+    with os.scandir(VIDEO_DIR) as it:
+        video_names = {e.name for e in it}
+    with os.scandir(JSON_DIR) as it:
+        json_entries = [(e.name, e.stat().st_mtime) for e in it]
+    json_names = {name for name, _ in json_entries}
+
+    # Map each recording to its landmark file, preferring the compressed
+    # .npz format over legacy .json dumps
+    data_files = {}
+    for name, mtime in json_entries:
+        if name.endswith('.npz'):
+            data_files[name[:-len('.npz')]] = (name, mtime)
+        elif name.endswith('.json'):
+            data_files.setdefault(name[:-len('.json')], (name, mtime))
+
+    for base_name, (json_file, mtime) in data_files.items():
         video_file = f"{base_name}.avi"
         metrics_file = f"{base_name}_metrics.png"
 
-        video_path = os.path.join(VIDEO_DIR, video_file)
+        # Skip recordings whose video is missing
+        if video_file not in video_names:
+            continue
+
         json_path = os.path.join(JSON_DIR, json_file)
-        metrics_path = os.path.join(JSON_DIR, metrics_file)
-
-        # Check if all files exist
-        if os.path.exists(video_path) and os.path.exists(json_path):
-            # Calculate tap count from JSON data
-            tap_count = 0
-            with open(json_path, 'r') as f:
-                landmarks_list = json.load(f)
-
-            # Compute metrics
-            times, amp, _ = compute_metrics(landmarks_list, 20)  # FPS=20
-
-            # Count taps using state machine
-            states = []
-            for d in amp:
-                if d <= 0.5:
-                    states.append("closed")
-                elif d >= 0.8:
-                    states.append("open")
-                else:
-                    states.append(None)
-
-            # Count open→closed transitions
-            prev = None
-            for st in states:
-                if prev == "open" and st == "closed":
-                    tap_count += 1
-                if st in ("open", "closed"):
-                    prev = st
-
-            # Add recording info to list
-            recordings.append({
-                "name": base_name,
-                "video_path": video_path,
-                "json_path": json_path,
-                "metrics_path": metrics_path if os.path.exists(metrics_path) else None,
-                "tap_count": tap_count,
-                "timestamp": base_name.replace("tap_", "")
-            })
-
-    # Sort by timestamp (newest first)
-    recordings.sort(key=lambda x: x["timestamp"], reverse=True)
+
+        # Calculate tap count from JSON data (cached per file)
+        tap_count = _cached_tap_count(json_path, mtime)
+
+        # Add recording info to list
+        recordings.append({
+            "name": base_name,
+            "video_path": os.path.join(VIDEO_DIR, video_file),
+            "json_path": json_path,
+            "metrics_path": os.path.join(JSON_DIR, metrics_file) if metrics_file in json_names else None,
+            "tap_count": tap_count,
+            "timestamp": base_name.replace("tap_", ""),
+            "mtime": mtime,
+        })
+
+    # Sort by modification time (newest first)
+    recordings.sort(key=lambda x: x["mtime"], reverse=True)
+
+    _recordings_cache["key"] = cache_key
+    _recordings_cache["value"] = recordings
     return recordings
 
 
-def generate_plot_image(json_path):
-    """Generate plot image from JSON data and return as base64 string."""
-    with open(json_path, 'r') as f:
-        landmarks_list = json.load(f)
+# One reused figure rendered through the Agg canvas: skips pyplot's state
+# machine and per-request figure construction, the dominant plotting cost
+_metrics_fig = Figure(figsize=(10, 4))
+
+
+@functools.lru_cache(maxsize=256)
+def _metrics_png(json_path, mtime):
+    """Render the metrics plot for one recording as PNG bytes, cached on (path, mtime)."""
+    landmarks_list = load_landmarks(json_path)
 
     # Compute metrics
     times, amp, speed = compute_metrics(landmarks_list, 20)  # FPS=20
 
     # Create plot
-    plt.figure(figsize=(10, 4))
-    plt.subplot(1, 2, 1)
-    plt.plot(times, amp)
-    plt.title("Normalized Tap Amplitude")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Amplitude (a.u.)")
-
-    plt.subplot(1, 2, 2)
-    plt.plot(times, speed)
-    plt.title("Tap Speed")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Speed (a.u./s)")
-    plt.tight_layout()
-
-    # Convert plot to base64 string
+    _metrics_fig.clear()
+    ax1 = _metrics_fig.add_subplot(1, 2, 1)
+    ax1.plot(times, amp)
+    ax1.set_title("Normalized Tap Amplitude")
+    ax1.set_xlabel("Time (s)")
+    ax1.set_ylabel("Amplitude (a.u.)")
+
+    ax2 = _metrics_fig.add_subplot(1, 2, 2)
+    ax2.plot(times, speed)
+    ax2.set_title("Tap Speed")
+    ax2.set_xlabel("Time (s)")
+    ax2.set_ylabel("Speed (a.u./s)")
+    _metrics_fig.tight_layout()
+
     buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    buf.seek(0)
-    img_str = base64.b64encode(buf.read()).decode('utf-8')
+    FigureCanvasAgg(_metrics_fig).print_png(buf)
+    return buf.getvalue()
+
+
+def generate_plot_image(json_path):
+    """Generate plot image from JSON data and return as base64 string."""
+    png = _metrics_png(json_path, os.path.getmtime(json_path))
+    img_str = base64.b64encode(png).decode('utf-8')
     return f"data:image/png;base64,{img_str}"
 
 
@@ -165,12 +191,82 @@ async def get_recording_details(request: Request, recording_name: str):
     )
 
 
+# Allowed recording names: no separators, so the join below can never
+# escape VIDEO_DIR (one precompiled check instead of path gymnastics)
+_NAME_RE = re.compile(r"[A-Za-z0-9_\-.]+")
+
+
 @app.get("/video/{recording_name}")
-async def get_video(recording_name: str):
+async def get_video(recording_name: str, request: Request):
+    if not _NAME_RE.fullmatch(recording_name):
+        return {"error": "Video not found"}
+
     video_path = os.path.join(VIDEO_DIR, f"{recording_name}.avi")
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/x-msvideo")
-    return {"error": "Video not found"}
+
+    # One stat covers the existence check, the file size, and (passed on to
+    # FileResponse) the headers, instead of separate exists/getsize calls
+    try:
+        stat_result = os.stat(video_path)
+    except OSError:
+        return {"error": "Video not found"}
+
+    # Recordings are immutable once written, so a strong ETag plus a
+    # long-lived Cache-Control lets the browser replay from its cache (304)
+    # instead of re-downloading the clip
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return FileResponse(video_path, media_type="video/x-msvideo",
+                            stat_result=stat_result, headers=cache_headers)
+
+    # Serve the requested byte range (206) so the <video> tag can seek
+    # without downloading the whole file first
+    file_size = stat_result.st_size
+    try:
+        range_spec = range_header.split("=", 1)[1]
+        start_str, _, end_str = range_spec.partition("-")
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+        else:
+            # Suffix range ("bytes=-N"): the last N bytes of the file
+            start = max(0, file_size - int(end_str))
+            end = file_size - 1
+    except (IndexError, ValueError):
+        start, end = 0, file_size - 1
+    end = min(end, file_size - 1)
+    if start > end:
+        return Response(status_code=416,
+                        headers={"Content-Range": f"bytes */{file_size}",
+                                 **cache_headers})
+    length = end - start + 1
+
+    def iter_range(chunk_size=1 << 20):
+        with open(video_path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    headers = {
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(length),
+        **cache_headers,
+    }
+    return StreamingResponse(iter_range(), status_code=206,
+                             headers=headers, media_type="video/x-msvideo")
 
 
 # Create HTML templates
@@ -364,12 +460,15 @@ details_html = """
 </html>
 """
 
-# Create template files
-with open("templates/index.html", "w", encoding="utf-8") as f:
-    f.write(index_html)
+# Create template files only when missing or out of date: unconditional
+# rewrites bump the mtime every start and invalidate Jinja2's template cache
+def _write_template_if_changed(path, content):
+    p = Path(path)
+    if not p.exists() or p.read_text(encoding="utf-8") != content:
+        p.write_text(content, encoding="utf-8")
 
-with open("templates/recording_details.html", "w", encoding="utf-8") as f:
-    f.write(details_html)
+_write_template_if_changed("templates/index.html", index_html)
+_write_template_if_changed("templates/recording_details.html", details_html)
 
 if __name__ == "__main__":
     print("Starting Finger Tapping Analysis Dashboard...")
@@ -2,10 +2,17 @@
 import os
 import cv2
 import time
-import json
+import queue
+import functools
+import threading
 import numpy as np
 import mediapipe as mp
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")  # plots are saved to file; skip GUI backend startup
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from Camera.frame_grabber import FrameGrabber
 
 # ─── USER CONFIG ─────────────────────────────────────────────────────────────
 VIDEO_DIR      = "recordings"
@@ -17,77 +24,154 @@ os.makedirs(VIDEO_DIR, exist_ok=True)
 os.makedirs(JSON_DIR, exist_ok=True)
 
 # ─── MediaPipe Hands setup ──────────────────────────────────────────────────
+# Built once and reused for the whole session: the solver carries its
+# tracking state (hand ROI from the previous frame) across frames, so the
+# palm detector only re-runs when tracking is lost. The higher tracking
+# threshold keeps that fast path honest during the recording window.
 mp_hands = mp.solutions.hands
 hands    = mp_hands.Hands(
     static_image_mode=False,
     max_num_hands=1,
+    model_complexity=0,  # lite landmark model; plenty for open/closed states
     min_detection_confidence=0.6,
-    min_tracking_confidence=0.6,
+    min_tracking_confidence=0.7,
 )
 
-def hand_state(lm):
+# Hoisted out of the draw loop: saves the dotted-name resolution per frame
+_draw_landmarks    = mp.solutions.drawing_utils.draw_landmarks
+_HAND_CONNECTIONS  = mp_hands.HAND_CONNECTIONS
+
+# Landmark indices used by the state check
+TIPS = np.array([8, 12, 16, 20])
+PIPS = np.array([6, 10, 14, 18])
+
+def landmarks_to_array(lm):
+    """Extract all 21 landmarks into a (21,3) float32 array in one pass."""
+    return np.fromiter(
+        (v for p in lm.landmark for v in (p.x, p.y, p.z)),
+        dtype=np.float32, count=63,
+    ).reshape(21, 3)
+
+# Per-frame finger-extension count, JIT-compiled when Numba is installed;
+# the NumPy fallback keeps the script dependency-free
+try:
+    from numba import njit
+
+    @njit(cache=True)
+    def _extended_count(ys):
+        ext = 0
+        for i in range(4):
+            if ys[TIPS[i]] < ys[PIPS[i]]:
+                ext += 1
+        return ext
+except ImportError:
+    def _extended_count(ys):
+        return int((ys[TIPS] < ys[PIPS]).sum())
+
+def hand_state(arr):
     """
     Returns "open" if index/middle/ring/pinky are extended,
     "closed" if all four are bent, else None.
+    arr: (21,3) landmark array from landmarks_to_array.
     """
-    tips = [8, 12, 16, 20]
-    pips = [6, 10, 14, 18]
-    extended = bent = 0
-
-    for tip_id, pip_id in zip(tips, pips):
-        if lm.landmark[tip_id].y < lm.landmark[pip_id].y:
-            extended += 1
-        else:
-            bent += 1
-
-    if extended == 4:
-        return "open"
-    if bent == 4:
-        return "closed"
-    return None
+    # 4 fingers extended → open, 0 → closed, anything mixed → None
+    return ("closed", None, None, None, "open")[_extended_count(arr[:, 1])]
 
 def compute_metrics(landmarks_list, fps):
     """
     Given a list of frames each containing 21 landmarks [x,y,z],
     compute normalized amplitude (index_tip ↔ wrist) and speed.
     """
-    arr = np.array(landmarks_list)  # shape: (N, 21, 3)
+    arr = np.asarray(landmarks_list, dtype=np.float32)  # (N,21,3); no copy if already float32
     WRIST, INDEX_TIP, MIDDLE_MCP = 0, 8, 9
 
-    # raw distances
-    dist_tip = np.linalg.norm(arr[:, INDEX_TIP, :2] - arr[:, WRIST, :2], axis=1)
-    dist_ref = np.linalg.norm(arr[:, MIDDLE_MCP, :2] - arr[:, WRIST, :2], axis=1)
+    # distances (hypot over x/y diffs: one pass, no squared intermediates);
+    # the dx/dy scratch arrays are reused for both distances via out=
+    dx = arr[:, INDEX_TIP, 0] - arr[:, WRIST, 0]
+    dy = arr[:, INDEX_TIP, 1] - arr[:, WRIST, 1]
+    dist_tip = np.hypot(dx, dy)
+    np.subtract(arr[:, MIDDLE_MCP, 0], arr[:, WRIST, 0], out=dx)
+    np.subtract(arr[:, MIDDLE_MCP, 1], arr[:, WRIST, 1], out=dy)
+    dist_ref = np.hypot(dx, dy)
 
-    amp_norm = dist_tip / dist_ref
-    times    = np.arange(len(amp_norm)) / fps
-    speed    = np.gradient(amp_norm, times)
+    amp_norm  = dist_tip
+    amp_norm /= dist_ref  # in place; dist_tip is not needed afterwards
+    times     = np.arange(len(amp_norm)) / fps
+
+    # central differences on the uniform grid, without np.gradient's
+    # spacing handling and intermediate arrays
+    speed = np.empty_like(amp_norm)
+    speed[1:-1] = (amp_norm[2:] - amp_norm[:-2]) * (fps * 0.5)
+    speed[0]    = (amp_norm[1]  - amp_norm[0])   * fps
+    speed[-1]   = (amp_norm[-1] - amp_norm[-2])  * fps
 
     return times, amp_norm, speed
 
 def plot_metrics(times, amp, speed, save_path=None):
-    """Plot normalized amplitude and speed over time."""
-    plt.figure(figsize=(10,4))
-
-    plt.subplot(1,2,1)
-    plt.plot(times, amp)
-    plt.title("Normalized Amplitude")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Amplitude (a.u.)")
-
-    plt.subplot(1,2,2)
-    plt.plot(times, speed)
-    plt.title("Movement Speed")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Speed (a.u./s)")
-
-    plt.tight_layout()
+    """Plot normalized amplitude and speed over time (rendered headlessly)."""
+    fig = Figure(figsize=(10,4))
+
+    ax1 = fig.add_subplot(1,2,1)
+    ax1.plot(times, amp)
+    ax1.set_title("Normalized Amplitude")
+    ax1.set_xlabel("Time (s)")
+    ax1.set_ylabel("Amplitude (a.u.)")
+
+    ax2 = fig.add_subplot(1,2,2)
+    ax2.plot(times, speed)
+    ax2.set_title("Movement Speed")
+    ax2.set_xlabel("Time (s)")
+    ax2.set_ylabel("Speed (a.u./s)")
+
+    fig.tight_layout()
     if save_path:
-        plt.savefig(save_path)
+        FigureCanvasAgg(fig).print_png(save_path)
         print(f"→ Saved metrics plot to {save_path}")
-    plt.show()
+
+# ─── Overlay banner ─────────────────────────────────────────────────────────
+# The status line changes at most once per second, so each unique text is
+# rasterized once and then blitted; cv2.putText re-renders glyphs every call
+BANNER_H = 45
+BANNER_W = 640
+
+@functools.lru_cache(maxsize=512)
+def render_banner(text, color):
+    """Rasterize one overlay line; returns the strip and its text-pixel mask."""
+    strip = np.zeros((BANNER_H, BANNER_W, 3), dtype=np.uint8)
+    cv2.putText(strip, text, (30, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+    return strip, strip.any(axis=2, keepdims=True)
+
+def draw_banner(frame, text, color):
+    """Blit a cached text strip onto the top of the frame."""
+    strip, mask = render_banner(text, color)
+    h = min(BANNER_H, frame.shape[0])
+    w = min(BANNER_W, frame.shape[1])
+    np.copyto(frame[:h, :w], strip[:h, :w], where=mask[:h, :w])
+
+def open_video_writer(path, fps, size):
+    """VideoWriter preferring H.264 ('avc1'), which most OpenCV/FFmpeg builds
+    hand to a hardware encoder, falling back to the XVID software encoder."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"avc1"), fps, size)
+    if writer.isOpened():
+        return writer
+    writer.release()
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"XVID"), fps, size)
+
+def encode_worker(frames, writer):
+    """Drain frames to the VideoWriter so encoding never stalls the capture loop."""
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        writer.write(frame)
 
 def main():
     cap = cv2.VideoCapture(0)
+    # MJPG cuts USB bandwidth and decodes with SIMD; a 1-frame buffer keeps
+    # the loop on the live frame instead of a stale queued one
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    cap.set(cv2.CAP_PROP_FPS, FPS)
     if not cap.isOpened():
         print("ERROR: Cannot open camera.")
         return
@@ -95,96 +179,151 @@ def main():
     width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+    # Reused half-size buffers: resize and cvtColor write into them instead
+    # of allocating fresh arrays every iteration
+    small = np.empty((height // 2, width // 2, 3), dtype=np.uint8)
+    rgb   = np.empty((height // 2, width // 2, 3), dtype=np.uint8)
+
     recording    = False
     out          = None
-    start_time   = None
+    encode_q     = None
+    encoder      = None
     vid_path     = None
-    json_path    = None
-    landmarks_buf = []
+    data_path    = None
     prev_state   = None
     count        = 0
 
+    # Preallocated landmark storage: frames are written in place instead of
+    # appending lists of tuples (slack for timing jitter past RECORD_SECONDS)
+    landmarks_buf = np.empty((FPS * RECORD_SECONDS + 32, 21, 3), dtype=np.float32)
+    frame_idx     = 0
+
+    # Recording ends after a fixed number of frames: an integer compare per
+    # iteration instead of wall-clock reads, and immune to clock jumps
+    target_frames = RECORD_SECONDS * FPS
+
     print("→ Press 'q' to quit.")
 
+    # Grab frames on a separate thread so inference always sees the newest one
+    grabber = FrameGrabber(cap)
+
+    display_counter = 0
+    banner_key      = None
+    banner_text     = ""
+
     while True:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
             break
 
-        frame = cv2.flip(frame, 1)
-        rgb   = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res   = hands.process(rgb)
+        cv2.flip(frame, 1, dst=frame)  # horizontal flip works in place
+
+        # Inference runs on a half-size copy: MediaPipe's palm detector cost
+        # scales with input area, and its landmarks are normalized, so the
+        # analytics and the drawing on the full-size frame are unaffected
+        cv2.resize(frame, (width // 2, height // 2), dst=small,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=rgb)
+
+        # Read-only input lets MediaPipe use the buffer without copying
+        rgb.flags.writeable = False
+        res = hands.process(rgb)
+        rgb.flags.writeable = True
+
+        # Convert the protobuf landmarks to an ndarray once per frame; every
+        # later consumer (state check, recording buffer) indexes this array
+        # instead of re-walking the repeated protobuf fields
+        if res.multi_hand_landmarks:
+            lm_arr = landmarks_to_array(res.multi_hand_landmarks[0])
 
         if not recording:
-            cv2.putText(frame, "Show open fist to start...", (30,30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+            draw_banner(frame, "Show open fist to start...", (0,255,0))
             if res.multi_hand_landmarks:
-                lm = res.multi_hand_landmarks[0]
-                if hand_state(lm) == "open":
+                if hand_state(lm_arr) == "open":
                     ts = time.strftime("%Y%m%d-%H%M%S")
                     vid_path  = os.path.join(VIDEO_DIR, f"fist_{ts}.avi")
-                    json_path = os.path.join(JSON_DIR,  f"fist_{ts}.json")
-                    fourcc    = cv2.VideoWriter_fourcc(*"XVID")
-                    out       = cv2.VideoWriter(vid_path, fourcc, FPS, (width, height))
-                    start_time = time.time()
+                    data_path = os.path.join(JSON_DIR,  f"fist_{ts}.npz")
+                    out       = open_video_writer(vid_path, FPS, (width, height))
+                    # Encoding runs on its own thread, fed through a bounded
+                    # queue so a slow disk applies backpressure, not drops
+                    encode_q  = queue.Queue(maxsize=4)
+                    encoder   = threading.Thread(target=encode_worker,
+                                                 args=(encode_q, out), daemon=True)
+                    encoder.start()
                     recording  = True
-                    landmarks_buf = []
+                    frame_idx  = 0
                     count       = 0
                     prev_state  = "open"
                     print(f"→ Detected open fist, recording {RECORD_SECONDS}s to {vid_path} ...")
         else:
-            elapsed = time.time() - start_time
             if not res.multi_hand_landmarks:
                 print("→ Hand lost! Discarding clip.")
+                encode_q.put(None)
+                encoder.join()
                 out.release()
                 os.remove(vid_path)
                 recording = False
             else:
-                lm = res.multi_hand_landmarks[0]
                 # store landmarks
-                landmarks_buf.append([(pt.x, pt.y, pt.z) for pt in lm.landmark])
+                if frame_idx < len(landmarks_buf):
+                    landmarks_buf[frame_idx] = lm_arr
+                    frame_idx += 1
 
-                state = hand_state(lm)
+                state = hand_state(lm_arr)
                 if prev_state == "open" and state == "closed":
                     count += 1
                 if state in ("open","closed"):
                     prev_state = state
 
-                out.write(frame)
-                secs_left = max(0, RECORD_SECONDS - int(elapsed))
-                cv2.putText(frame,
-                            f"Recording... {secs_left}s | cycles: {count}",
-                            (30,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
+                # Copy: the encoder thread writes the frame later, after the
+                # overlays below have been drawn on the original
+                encode_q.put(frame.copy())
+                secs_left = (target_frames - frame_idx + FPS - 1) // FPS
+                # Re-format the banner text only when it actually changes
+                # (~once per second), not on every frame
+                if (secs_left, count) != banner_key:
+                    banner_key  = (secs_left, count)
+                    banner_text = f"Recording... {secs_left}s | cycles: {count}"
+                draw_banner(frame, banner_text, (0,0,255))
 
-                if elapsed >= RECORD_SECONDS:
+                if frame_idx >= target_frames:
+                    encode_q.put(None)
+                    encoder.join()
                     out.release()
                     print(f"→ Done! Saved video to {vid_path}")
                     print(f"→ You did {count} open→closed cycles.")
 
-                    # save JSON
-                    with open(json_path, "w") as f:
-                        json.dump(landmarks_buf, f)
-                    print(f"→ Saved landmarks to {json_path}")
+                    recorded = landmarks_buf[:frame_idx]
+
+                    # save landmarks (compressed binary; ~10x smaller than JSON
+                    # and loads without text parsing)
+                    np.savez_compressed(data_path, landmarks=recorded.astype(np.float16))
+                    print(f"→ Saved landmarks to {data_path}")
 
                     # compute & plot metrics
-                    times, amp, speed = compute_metrics(landmarks_buf, FPS)
-                    plot_path = json_path.replace(".json", "_metrics.png")
+                    times, amp, speed = compute_metrics(recorded, FPS)
+                    plot_path = data_path.replace(".npz", "_metrics.png")
                     plot_metrics(times, amp, speed, save_path=plot_path)
                     break
 
-        # draw landmarks
-        if res.multi_hand_landmarks:
-            for lm in res.multi_hand_landmarks:
-                mp.solutions.drawing_utils.draw_landmarks(
-                    frame, lm, mp_hands.HAND_CONNECTIONS
-                )
+        # Refresh the preview at half the capture rate: draw_landmarks walks
+        # the 21 keypoints in Python and imshow pumps GUI events, neither of
+        # which the encoder or the analytics need
+        display_counter += 1
+        if display_counter % 2 == 0:
+            if res.multi_hand_landmarks:
+                for lm in res.multi_hand_landmarks:
+                    _draw_landmarks(frame, lm, _HAND_CONNECTIONS)
 
-        cv2.imshow("Fist Cycle Recorder", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            cv2.imshow("Fist Cycle Recorder", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
     # cleanup
+    grabber.stop()
     if recording and out:
+        encode_q.put(None)
+        encoder.join()
         out.release()
     cap.release()
     cv2.destroyAllWindows()